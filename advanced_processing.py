@@ -20,48 +20,109 @@ def optimize_seams(left_img, right_img, overlap_width):
     right_overlap = right_img[:, :overlap_width]
     
     # 创建权重矩阵进行线性过渡
-    weight = np.zeros((h, overlap_width), dtype=np.float32)
-    for i in range(overlap_width):
-        weight[:, i] = (overlap_width - i) / overlap_width
+    weight = np.linspace(1.0, 0.0, overlap_width, endpoint=False,
+                         dtype=np.float32).reshape(1, overlap_width, 1)
     
-    # 应用权重进行融合
-    blended_overlap = (left_overlap * weight[:, :, np.newaxis] + 
-                       right_overlap * (1 - weight[:, :, np.newaxis]))
+    # 应用权重进行融合：blended = right + (left - right) * weight，
+    # 按列权重通过广播作用于所有行和通道，只使用一个float32临时缓冲区
+    blended_overlap = np.subtract(left_overlap, right_overlap, dtype=np.float32)
+    np.multiply(blended_overlap, weight, out=blended_overlap)
+    np.add(blended_overlap, right_overlap, out=blended_overlap)
     
     # 合并左侧、融合区域和右侧
-    result = np.zeros((h, w*2-overlap_width, 3), dtype=np.uint8)
+    result = np.empty((h, w*2-overlap_width, 3), dtype=np.uint8)
     result[:, :w-overlap_width] = left_img[:, :w-overlap_width]
-    result[:, w-overlap_width:w] = blended_overlap
+    np.copyto(result[:, w-overlap_width:w], blended_overlap, casting='unsafe')
     result[:, w:] = right_img[:, overlap_width:]
     
     return result
 
 
-def equalize_brightness(img):
+def equalize_brightness(img, clahe=None, luma_lut=None, dst=None, ycrcb=None, luma=None):
     """
     平衡图像亮度
     
     参数:
         img: 输入图像
+        clahe: 可复用的CLAHE对象，为None时临时创建
+        luma_lut: 预先估计的全局亮度查找表（见 fit_luma_lut、estimate_luma_lut），
+                  提供时以查表代替CLAHE
+        dst: 可选的输出缓冲区
+        ycrcb, luma: 可选的YCrCb图像与亮度通道缓冲区，逐帧调用时复用以避免重复分配
         
     返回:
         亮度均衡后的图像
     """
-    # 转换到LAB颜色空间
-    lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
-    l, a, b = cv2.split(lab)
+    # 转换到YCrCb颜色空间（比LAB转换开销更小）
+    ycrcb = cv2.cvtColor(img, cv2.COLOR_BGR2YCrCb, dst=ycrcb)
     
-    # 对亮度通道应用自适应直方图均衡
-    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-    cl = clahe.apply(l)
+    # 只取出亮度通道处理，色度通道保持原位
+    luma = cv2.extractChannel(ycrcb, 0, dst=luma)
     
-    # 合并通道
-    limg = cv2.merge((cl, a, b))
+    if luma_lut is not None:
+        # 使用缓存的全局查找表近似CLAHE结果
+        cv2.LUT(luma, luma_lut, dst=luma)
+    else:
+        if clahe is None:
+            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+        # 对亮度通道应用自适应直方图均衡（原地写回）
+        clahe.apply(luma, dst=luma)
+    
+    # 写回亮度通道
+    cv2.insertChannel(luma, ycrcb, 0)
     
     # 转换回BGR颜色空间
-    equalized = cv2.cvtColor(limg, cv2.COLOR_LAB2BGR)
+    return cv2.cvtColor(ycrcb, cv2.COLOR_YCrCb2BGR, dst=dst)
+
+
+def estimate_luma_lut(original, equalized, step=4):
+    """
+    根据均衡前后的图像估计全局亮度查找表，用于在后续帧中近似CLAHE
+    
+    参数:
+        original: 均衡前的图像
+        equalized: 均衡后的图像
+        step: 统计时的降采样步长
+        
+    返回:
+        256x1 的亮度查找表
+    """
+    y0 = cv2.cvtColor(np.ascontiguousarray(original[::step, ::step]), cv2.COLOR_BGR2YCrCb)[:, :, 0]
+    y1 = cv2.cvtColor(np.ascontiguousarray(equalized[::step, ::step]), cv2.COLOR_BGR2YCrCb)[:, :, 0]
+    return _fit_luma_lut(y0, y1)
+
+
+def fit_luma_lut(img, clahe=None, step=4):
+    """
+    在降采样图像上运行CLAHE并拟合全局亮度查找表，无需对全分辨率图像做均衡
+    
+    CLAHE按相对位置划分网格、裁剪阈值按网格像素数缩放，降采样后的亮度映射与原图接近。
     
-    return equalized
+    参数:
+        img: 输入图像（BGR）
+        clahe: 可复用的CLAHE对象，为None时临时创建
+        step: 降采样步长（输入已是缩略图时传1）
+        
+    返回:
+        256x1 的亮度查找表
+    """
+    if clahe is None:
+        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+    small = np.ascontiguousarray(img[::step, ::step])
+    y0 = cv2.extractChannel(cv2.cvtColor(small, cv2.COLOR_BGR2YCrCb), 0)
+    return _fit_luma_lut(y0, clahe.apply(y0))
+
+
+def _fit_luma_lut(y0, y1):
+    """每个原始亮度值映射到其均衡后亮度的均值，未出现的亮度值线性插值"""
+    y0 = y0.ravel()
+    counts = np.bincount(y0, minlength=256)
+    sums = np.bincount(y0, weights=y1.ravel(), minlength=256)
+    present = np.flatnonzero(counts)
+    if present.size == 0:
+        return np.arange(256, dtype=np.uint8).reshape(256, 1)
+    lut = np.interp(np.arange(256), present, sums[present] / counts[present])
+    return np.round(lut).astype(np.uint8).reshape(256, 1)
 
 
 def multi_band_blending(img1, img2, mask, levels=4):
@@ -81,17 +142,14 @@ def multi_band_blending(img1, img2, mask, levels=4):
     img1 = img1.astype(np.float32) / 255.0
     img2 = img2.astype(np.float32) / 255.0
     
-    # 创建拉普拉斯金字塔
+    # 创建拉普拉斯金字塔: [基础层, 第0层(原尺寸)拉普拉斯, 第1层拉普拉斯, ...]
     def build_laplacian_pyramid(img, levels):
         pyramid = [img]
         for i in range(levels):
-            # 高斯滤波
             current = pyramid[0]
-            blurred = cv2.GaussianBlur(current, (5, 5), 0)
-            # 下采样
-            downsampled = cv2.resize(blurred, (blurred.shape[1] // 2, blurred.shape[0] // 2))
-            # 上采样
-            upsampled = cv2.resize(downsampled, (current.shape[1], current.shape[0]))
+            # pyrDown/pyrUp 在一次处理中完成5x5高斯滤波与2倍重采样
+            downsampled = cv2.pyrDown(current)
+            upsampled = cv2.pyrUp(downsampled, dstsize=(current.shape[1], current.shape[0]))
             # 计算拉普拉斯差值
             laplacian = current - upsampled
             # 更新金字塔
@@ -103,36 +161,35 @@ def multi_band_blending(img1, img2, mask, levels=4):
     lap1 = build_laplacian_pyramid(img1, levels)
     lap2 = build_laplacian_pyramid(img2, levels)
     
-    # 构建掩码的高斯金字塔
-    mask_pyramid = [mask]
-    mask_float = mask.astype(np.float32) / 255.0
+    # 构建掩码的高斯金字塔（第i项与第i层拉普拉斯尺寸一致，最后一项对应基础层）
+    mask_float = np.ascontiguousarray(mask, dtype=np.float32) / 255.0
+    mask_pyramid = [mask_float]
     for i in range(levels):
-        mask_float = cv2.resize(cv2.GaussianBlur(mask_float, (5, 5), 0), 
-                               (mask_float.shape[1] // 2, mask_float.shape[0] // 2))
+        mask_float = cv2.pyrDown(mask_float)
         mask_pyramid.append(mask_float)
+    mask_pyramid = [mask_pyramid[levels]] + mask_pyramid[:levels]
     
     # 融合金字塔
     blended_pyramid = []
-    for i, (l1, l2, m) in enumerate(zip(lap1, lap2, mask_pyramid)):
-        if i == 0:  # 基础图像级别
-            blended = l1 * (1.0 - m) + l2 * m
-        else:  # 拉普拉斯级别
-            m_expanded = np.expand_dims(m, axis=2) if m.ndim == 2 else m
-            blended = l1 * (1.0 - m_expanded) + l2 * m_expanded
+    for l1, l2, m in zip(lap1, lap2, mask_pyramid):
+        if m.ndim == 2 and l1.ndim == 3:
+            m = np.expand_dims(m, axis=2)
+        blended = l1 * (1.0 - m) + l2 * m
         blended_pyramid.append(blended)
     
-    # 重建融合图像
+    # 重建融合图像：从基础层开始逐层上采样并叠加拉普拉斯层
     result = blended_pyramid[0]
-    for i in range(levels):
-        result = cv2.resize(result, (blended_pyramid[i+1].shape[1], blended_pyramid[i+1].shape[0]))
-        result += blended_pyramid[i+1]
+    for i in reversed(range(levels)):
+        laplacian = blended_pyramid[i+1]
+        result = cv2.pyrUp(result, dstsize=(laplacian.shape[1], laplacian.shape[0]))
+        result += laplacian
     
     # 剪裁并转换回8位
     result = np.clip(result * 255.0, 0, 255).astype(np.uint8)
     return result
 
 
-def detect_and_match_features(img1, img2, method='sift'):
+def detect_and_match_features(img1, img2, method='orb'):
     """
     检测并匹配两个图像中的特征点
     
@@ -167,28 +224,39 @@ def detect_and_match_features(img1, img2, method='sift'):
     
     # 特征匹配
     if method.lower() == 'sift' or method.lower() == 'akaze':
-        matcher = cv2.BFMatcher(cv2.NORM_L2)
-    else:  # ORB使用汉明距离
-        matcher = cv2.BFMatcher(cv2.NORM_HAMMING)
-    
-    # 获取k个最佳匹配
-    matches = matcher.knnMatch(des1, des2, k=2)
-    
-    # 应用Lowe过滤
-    good_matches = []
-    for m, n in matches:
-        if m.distance < 0.75 * n.distance:
-            good_matches.append(m)
+        # 暴力匹配：batchDistance 直接以数组返回每个特征的两个最近邻，
+        # Lowe比率测试在数组上一次完成，只为通过的匹配创建 DMatch
+        dist, nidx = cv2.batchDistance(des1, des2, cv2.CV_32F, normType=cv2.NORM_L2, K=2)
+        keep = np.flatnonzero(dist[:, 0] < 0.75 * dist[:, 1])
+        good_matches = [cv2.DMatch(int(i), int(nidx[i, 0]), float(dist[i, 0])) for i in keep]
+    else:  # ORB为二进制描述符，使用FLANN的LSH索引近似匹配
+        index_params = dict(algorithm=6,  # FLANN_INDEX_LSH
+                            table_number=6, key_size=12, multi_probe_level=1)
+        matcher = cv2.FlannBasedMatcher(index_params, {})
+        
+        # 获取k个最佳匹配
+        matches = matcher.knnMatch(des1, des2, k=2)
+        
+        # 应用Lowe过滤
+        good_matches = []
+        for pair in matches:
+            # LSH可能为部分特征点返回少于2个近邻
+            if len(pair) == 2 and pair[0].distance < 0.75 * pair[1].distance:
+                good_matches.append(pair[0])
     
     return good_matches, kp1, kp2
 
 
+# USAC_MAGSAC 比传统RANSAC更快更稳健（OpenCV 4.5.1+），旧版本回退到RANSAC
+_HOMOGRAPHY_METHOD = getattr(cv2, 'USAC_MAGSAC', cv2.RANSAC)
+
+
 def find_homography(kp1, kp2, good_matches):
     """
     使用匹配的特征点计算两个图像之间的单应性变换
     
     参数:
-        kp1, kp2: SIFT/ORB关键点
+        kp1, kp2: SIFT/ORB关键点，或预先提取的 Nx2 float32 坐标数组
         good_matches: 关键点匹配
         
     返回:
@@ -197,16 +265,60 @@ def find_homography(kp1, kp2, good_matches):
     if len(good_matches) < 4:
         return None
     
+    # 关键点坐标只需提取一次，之后通过匹配索引数组批量取值
+    pts1 = kp1 if isinstance(kp1, np.ndarray) else cv2.KeyPoint_convert(kp1)
+    pts2 = kp2 if isinstance(kp2, np.ndarray) else cv2.KeyPoint_convert(kp2)
+    
+    count = len(good_matches)
+    query_idx = np.fromiter((m.queryIdx for m in good_matches), dtype=np.int32, count=count)
+    train_idx = np.fromiter((m.trainIdx for m in good_matches), dtype=np.int32, count=count)
+    
     # 提取匹配点的坐标
-    src_pts = np.float32([kp1[m.queryIdx].pt for m in good_matches]).reshape(-1, 1, 2)
-    dst_pts = np.float32([kp2[m.trainIdx].pt for m in good_matches]).reshape(-1, 1, 2)
+    src_pts = pts1[query_idx].reshape(-1, 1, 2)
+    dst_pts = pts2[train_idx].reshape(-1, 1, 2)
     
-    # 使用RANSAC算法计算单应性矩阵
-    H, mask = cv2.findHomography(src_pts, dst_pts, cv2.RANSAC, 5.0)
+    # 使用鲁棒估计算法计算单应性矩阵
+    H, mask = cv2.findHomography(src_pts, dst_pts, _HOMOGRAPHY_METHOD, 5.0)
     
     return H
 
 
+def _build_lut(low, high):
+    """
+    构建线性拉伸查找表：低于low映射为0，高于high映射为255
+    """
+    x = np.arange(256, dtype=np.float32)
+    y = np.clip(np.round((x - low) * (255.0 / max(high - low, 1))), 0, 255)
+    return y.astype(np.uint8).reshape(256, 1)
+
+
+def _channel_cut_points(channel, low_cut=0.01, high_cut=0.99, step=4):
+    """
+    在降采样后的通道上统计累积分布，返回低/高截断点灰度值
+    """
+    sample = channel[::step, ::step]
+    cdf = np.bincount(sample.ravel(), minlength=256).cumsum()
+    low, high = np.searchsorted(cdf, [low_cut * cdf[-1], high_cut * cdf[-1]])
+    return low, high
+
+
+def color_balance_lut(img, step=4):
+    """
+    为BGR图像的三个通道构建合并的 256x1x3 查找表
+    
+    参数:
+        img: 输入图像
+        step: 统计截断点时的降采样步长
+        
+    返回:
+        可直接用于 cv2.LUT 的查找表
+    """
+    lut = np.empty((256, 1, 3), dtype=np.uint8)
+    for c in range(3):
+        lut[:, :, c] = _build_lut(*_channel_cut_points(img[:, :, c], step=step))
+    return lut
+
+
 def color_balance(img):
     """
     自动白平衡算法
@@ -217,70 +329,6 @@ def color_balance(img):
     返回:
         颜色平衡后的图像
     """
-    # 将图像分割为BGR通道
-    b, g, r = cv2.split(img)
-    
-    # 计算每个通道的累积直方图
-    bins = 256
-    b_hist = cv2.calcHist([b], [0], None, [bins], [0, 256])
-    g_hist = cv2.calcHist([g], [0], None, [bins], [0, 256])
-    r_hist = cv2.calcHist([r], [0], None, [bins], [0, 256])
-    
-    # 计算累积分布函数
-    b_cdf = b_hist.cumsum()
-    g_cdf = g_hist.cumsum()
-    r_cdf = r_hist.cumsum()
-    
-    # 归一化累积分布函数
-    b_cdf_normalized = b_cdf / b_cdf[-1]
-    g_cdf_normalized = g_cdf / g_cdf[-1]
-    r_cdf_normalized = r_cdf / r_cdf[-1]
-    
-    # 找到低截断点 (1%) 和高截断点 (99%)
-    low_cut = 0.01
-    high_cut = 0.99
-    
-    b_low = np.searchsorted(b_cdf_normalized, low_cut)
-    b_high = np.searchsorted(b_cdf_normalized, high_cut)
-    g_low = np.searchsorted(g_cdf_normalized, low_cut)
-    g_high = np.searchsorted(g_cdf_normalized, high_cut)
-    r_low = np.searchsorted(r_cdf_normalized, low_cut)
-    r_high = np.searchsorted(r_cdf_normalized, high_cut)
-    
-    # 创建查找表
-    b_lookup = np.zeros((256,1), dtype=np.uint8)
-    g_lookup = np.zeros((256,1), dtype=np.uint8)
-    r_lookup = np.zeros((256,1), dtype=np.uint8)
-    
-    # 线性拉伸
-    for i in range(256):
-        if i < b_low:
-            b_lookup[i] = 0
-        elif i > b_high:
-            b_lookup[i] = 255
-        else:
-            b_lookup[i] = np.round(255.0 * (i - b_low) / (b_high - b_low))
-        
-        if i < g_low:
-            g_lookup[i] = 0
-        elif i > g_high:
-            g_lookup[i] = 255
-        else:
-            g_lookup[i] = np.round(255.0 * (i - g_low) / (g_high - g_low))
-        
-        if i < r_low:
-            r_lookup[i] = 0
-        elif i > r_high:
-            r_lookup[i] = 255
-        else:
-            r_lookup[i] = np.round(255.0 * (i - r_low) / (r_high - r_low))
-    
-    # 应用查找表
-    b_balanced = cv2.LUT(b, b_lookup)
-    g_balanced = cv2.LUT(g, g_lookup)
-    r_balanced = cv2.LUT(r, r_lookup)
-    
-    # 合并通道
-    balanced = cv2.merge([b_balanced, g_balanced, r_balanced])
-    
-    return balanced 
\ No newline at end of file
+    # 对每个通道找到1%和99%截断点并线性拉伸，
+    # 三个通道的查找表合并后只需一次 cv2.LUT 遍历，无需拆分/合并通道
+    return cv2.LUT(img, color_balance_lut(img))
@@ -4,7 +4,83 @@ import time
 import threading
 import json
 import os
-from advanced_processing import equalize_brightness, color_balance
+import math
+import hashlib
+from collections import deque
+from advanced_processing import equalize_brightness, fit_luma_lut, color_balance_lut
+
+try:
+    import numba
+except ImportError:  # Numba为可选依赖，缺失时使用NumPy向量化实现
+    numba = None
+
+# 映射表缓存目录
+MAP_CACHE_DIR = '.cache'
+
+# 映射表缓存最多保留的文件数，超出时删除最旧的
+MAP_CACHE_ENTRIES = 4
+
+
+def _build_maps(out_h, out_w, width, height,
+                l_cx, l_cy, l_r, l_off, r_cx, r_cy, r_r, r_off,
+                map_x, map_y):
+    """
+    逐像素计算双鱼眼到等距柱面投影的映射表（供Numba编译，按行并行）
+    
+    结果直接写入预分配的 map_x / map_y，不产生中间数组
+    """
+    for y in numba.prange(out_h):
+        phi = math.pi * y / out_h - math.pi / 2
+        cos_phi = math.cos(phi)
+        z_3d = math.sin(phi)
+        for x in range(out_w):
+            map_x[y, x] = 0
+            map_y[y, x] = 0
+            
+            theta = 2 * math.pi * x / out_w - math.pi
+            x_3d = cos_phi * math.cos(theta)
+            y_3d = cos_phi * math.sin(theta)
+            
+            # 确定使用哪个鱼眼镜头
+            if -math.pi / 2 <= theta <= math.pi / 2:
+                cx, cy, radius, offset = r_cx, r_cy, r_r, r_off
+            else:
+                cx, cy, radius, offset = l_cx, l_cy, l_r, l_off
+            
+            if x_3d * x_3d + z_3d * z_3d == 0:  # 避免除以零
+                continue
+            
+            theta_fisheye = math.atan2(y_3d, x_3d) + offset
+            c = z_3d / math.sqrt(x_3d * x_3d + y_3d * y_3d + z_3d * z_3d)
+            rho_fisheye = math.acos(min(1.0, max(-1.0, c))) / math.pi
+            
+            x_fisheye = cx * width + radius * width * rho_fisheye * math.cos(theta_fisheye)
+            y_fisheye = cy * height + radius * height * rho_fisheye * math.sin(theta_fisheye)
+            
+            if 0 <= x_fisheye < width and 0 <= y_fisheye < height:
+                map_x[y, x] = x_fisheye
+                map_y[y, x] = y_fisheye
+
+
+if numba is not None:
+    _build_maps = numba.njit(parallel=True, fastmath=True, cache=True)(_build_maps)
+
+
+def _cuda_available():
+    """检查OpenCV是否带有CUDA支持且存在可用设备"""
+    try:
+        return cv2.cuda.getCudaEnabledDeviceCount() > 0
+    except (AttributeError, cv2.error):
+        return False
+
+
+def _prune_map_cache():
+    """只保留最近写入的 MAP_CACHE_ENTRIES 个映射表缓存文件"""
+    paths = [os.path.join(MAP_CACHE_DIR, name) for name in os.listdir(MAP_CACHE_DIR)
+             if name.startswith('maps_') and name.endswith('.npz')]
+    paths.sort(key=os.path.getmtime, reverse=True)
+    for path in paths[MAP_CACHE_ENTRIES:]:
+        os.remove(path)
 
 
 class Insta360Processor:
@@ -29,6 +105,22 @@ class Insta360Processor:
         self.frame = None
         self.processed_frame = None
         self.lock = threading.Lock()
+        self.thread = None
+        self.process_thread = None
+        
+        # 采集线程与处理线程之间的单槽缓冲区：只保留最新的原始帧
+        self._raw_frames = deque(maxlen=1)
+        self._frame_ready = threading.Event()
+        
+        # 每处理完一帧时触发，供消费者等待新帧
+        self._new_frame_event = threading.Event()
+        
+        # 保护输出尺寸等处理参数，避免在处理某一帧的中途被修改
+        self._params_lock = threading.Lock()
+        
+        # 预览模式：仅需本地预览时以低分辨率处理
+        self.preview_mode = False
+        self._full_size = None
         
         # 尝试从文件加载鱼眼镜头参数
         self.fisheye_params = self._load_fisheye_params()
@@ -49,7 +141,7 @@ class Insta360Processor:
                 }
             }
         
-        # 计算映射表（在第一帧时初始化）
+        # 计算映射表（在第一帧时初始化，CPU处理时保存为定点格式）
         self.map_x = None
         self.map_y = None
         
@@ -57,6 +149,38 @@ class Insta360Processor:
         self.use_brightness_equalization = True
         self.use_color_balance = True
         self.overlap_width = int(self.output_width * 0.1)  # 重叠区域宽度，默认为总宽度的10%
+        
+        # 逐帧复用的全景图缓冲区（首帧时按输出尺寸分配，见 _ensure_buffers）
+        self._pano = None
+        self._pano_ycrcb = None
+        self._pano_luma = None
+        self._pano_equalized = None
+        
+        # 接缝融合使用的权重与缓冲区（首帧时按尺寸分配）
+        self._blend_weight = None
+        self._blend_diff = None
+        self._blend_out = None
+        
+        # 复用的CLAHE对象，避免每帧重新创建
+        self._clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+        
+        # 场景统计变化缓慢：每 enhance_interval 帧在降采样图像上重新运行CLAHE拟合亮度查找表、
+        # 统计色彩截断点，所有帧（CPU与GPU路径一致）都通过缓存的查找表输出
+        self.enhance_interval = 10
+        self._frame_counter = 0
+        self._luma_lut = None
+        self._color_lut = None
+        self._luma_lut_gpu = None
+        self._color_lut_gpu = None
+        
+        # CUDA加速（需要带CUDA支持的OpenCV及可用的GPU）
+        self.use_cuda = _cuda_available()
+        self._map_x_gpu = None
+        self._map_y_gpu = None
+        self._seam_weights_gpu = None
+        if self.use_cuda:
+            print("检测到CUDA设备，启用GPU处理")
+            self._gpu_frame = cv2.cuda_GpuMat()
     
     def _load_fisheye_params(self):
         """从文件加载鱼眼参数"""
@@ -84,15 +208,25 @@ class Insta360Processor:
         self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 960)  # 实际可能不同
         
         self.running = True
+        self._raw_frames.clear()
+        self._frame_ready.clear()
+        
+        # 采集与处理分别在独立线程中进行，处理耗时不会阻塞采集
         self.thread = threading.Thread(target=self._capture_loop)
         self.thread.daemon = True
+        self.process_thread = threading.Thread(target=self._process_loop)
+        self.process_thread.daemon = True
         self.thread.start()
+        self.process_thread.start()
         
     def stop(self):
         """停止视频捕获线程"""
         self.running = False
+        self._frame_ready.set()  # 唤醒等待中的处理线程
         if self.thread is not None:
             self.thread.join()
+        if self.process_thread is not None:
+            self.process_thread.join()
         if self.cap is not None:
             self.cap.release()
     
@@ -104,14 +238,33 @@ class Insta360Processor:
                 print("无法读取视频帧")
                 time.sleep(0.1)
                 continue
-                
-            # 处理帧
-            processed = self.process_frame(frame)
             
-            # 更新当前帧
+            # 更新原始帧，并交给处理线程（旧的未处理帧直接被覆盖）
             with self.lock:
                 self.frame = frame
+            self._raw_frames.append(frame)
+            self._frame_ready.set()
+    
+    def _process_loop(self):
+        """视频处理循环"""
+        while self.running:
+            if not self._frame_ready.wait(timeout=0.1):
+                continue
+            self._frame_ready.clear()
+            
+            try:
+                frame = self._raw_frames.popleft()
+            except IndexError:
+                continue
+            
+            # 处理帧
+            with self._params_lock:
+                processed = self.process_frame(frame)
+            
+            # 发布处理后的帧（只替换引用，已发布的帧不会再被修改）
+            with self.lock:
                 self.processed_frame = processed
+            self._new_frame_event.set()
     
     def _init_mapping_table(self, frame_shape):
         """
@@ -120,48 +273,103 @@ class Insta360Processor:
         height, width = frame_shape[:2]
         print("原始帧尺寸: {}x{}".format(width, height))
         
-        # 创建等距柱面投影的映射表
-        map_x = np.zeros((self.output_height, self.output_width), dtype=np.float32)
-        map_y = np.zeros((self.output_height, self.output_width), dtype=np.float32)
-        
-        # 计算每个像素的映射关系
-        for y in range(self.output_height):
-            for x in range(self.output_width):
-                # 等距柱面投影中的角度
-                theta = 2 * np.pi * x / self.output_width - np.pi  # 水平角度：-pi到pi
-                phi = np.pi * y / self.output_height - np.pi/2     # 垂直角度：-pi/2到pi/2
-                
-                # 3D球面坐标
-                x_3d = np.cos(phi) * np.cos(theta)
-                y_3d = np.cos(phi) * np.sin(theta)
-                z_3d = np.sin(phi)
-                
-                # 确定使用哪个鱼眼镜头
-                if -np.pi/2 <= theta <= np.pi/2:  # 使用右镜头 (-90° 到 90°)
-                    params = self.fisheye_params['right']
-                else:  # 使用左镜头 (90° 到 270°)
-                    params = self.fisheye_params['left']
-                
-                # 将3D点投影到鱼眼镜头平面
-                r = np.sqrt(x_3d*x_3d + z_3d*z_3d)
-                if r == 0:  # 避免除以零
-                    continue
-                    
-                # 鱼眼投影：与视角成正比的径向距离
-                theta_fisheye = np.arctan2(y_3d, x_3d)
-                rho_fisheye = np.arccos(z_3d / np.sqrt(x_3d*x_3d + y_3d*y_3d + z_3d*z_3d)) / np.pi
-                
-                # 加上角度偏移
-                theta_fisheye += params['offset_angle']
-                
-                # 转换到图像坐标
-                x_fisheye = params['cx'] * width + params['radius'] * width * rho_fisheye * np.cos(theta_fisheye)
-                y_fisheye = params['cy'] * height + params['radius'] * height * rho_fisheye * np.sin(theta_fisheye)
-                
-                # 确保坐标在图像内
-                if 0 <= x_fisheye < width and 0 <= y_fisheye < height:
-                    map_x[y, x] = x_fisheye
-                    map_y[y, x] = y_fisheye
+        if numba is not None:
+            # 使用Numba并行内核，避免NumPy实现的大量中间数组
+            left = self.fisheye_params['left']
+            right = self.fisheye_params['right']
+            map_x = np.empty((self.output_height, self.output_width), dtype=np.float32)
+            map_y = np.empty((self.output_height, self.output_width), dtype=np.float32)
+            _build_maps(self.output_height, self.output_width, width, height,
+                        *[float(p[k]) for p in (left, right)
+                          for k in ('cx', 'cy', 'radius', 'offset_angle')],
+                        map_x, map_y)
+            return map_x, map_y
+        
+        # 等距柱面投影中的角度（利用广播一次性计算所有像素）
+        x = np.arange(self.output_width, dtype=np.float32)
+        y = np.arange(self.output_height, dtype=np.float32)
+        theta = (2 * np.pi * x / self.output_width - np.pi)[None, :]      # 水平角度：-pi到pi
+        phi = (np.pi * y / self.output_height - np.pi / 2)[:, None]       # 垂直角度：-pi/2到pi/2
+        
+        # 3D球面坐标
+        cos_phi = np.cos(phi)
+        x_3d = cos_phi * np.cos(theta)
+        y_3d = cos_phi * np.sin(theta)
+        z_3d = np.broadcast_to(np.sin(phi), x_3d.shape)
+        
+        # 确定使用哪个鱼眼镜头：右镜头 (-90° 到 90°)，其余使用左镜头
+        right = np.broadcast_to((theta >= -np.pi / 2) & (theta <= np.pi / 2), x_3d.shape)
+        
+        # 鱼眼投影：与视角成正比的径向距离
+        theta_fisheye = np.arctan2(y_3d, x_3d)
+        norm = np.sqrt(x_3d * x_3d + y_3d * y_3d + z_3d * z_3d)
+        rho_fisheye = np.arccos(np.clip(z_3d / norm, -1.0, 1.0)) / np.pi
+        
+        # 按镜头参数转换到图像坐标
+        def project(params):
+            angle = theta_fisheye + params['offset_angle']
+            x_fisheye = params['cx'] * width + params['radius'] * width * rho_fisheye * np.cos(angle)
+            y_fisheye = params['cy'] * height + params['radius'] * height * rho_fisheye * np.sin(angle)
+            return x_fisheye, y_fisheye
+        
+        x_right, y_right = project(self.fisheye_params['right'])
+        x_left, y_left = project(self.fisheye_params['left'])
+        map_x = np.where(right, x_right, x_left).astype(np.float32)
+        map_y = np.where(right, y_right, y_left).astype(np.float32)
+        
+        # 图像外的坐标以及 x_3d、z_3d 同时为零的点（避免除以零）保持为0
+        valid = (x_3d * x_3d + z_3d * z_3d != 0) & \
+                (map_x >= 0) & (map_x < width) & (map_y >= 0) & (map_y < height)
+        map_x[~valid] = 0
+        map_y[~valid] = 0
+        
+        return map_x, map_y
+    
+    def _map_cache_path(self, frame_shape):
+        """根据输出尺寸、输入帧尺寸与鱼眼参数计算映射表缓存文件路径"""
+        key = json.dumps({
+            'output': [self.output_width, self.output_height],
+            'frame': list(frame_shape[:2]),
+            'fisheye_params': self.fisheye_params,
+            'fixed_point': not self.use_cuda,
+        }, sort_keys=True)
+        digest = hashlib.md5(key.encode('utf-8')).hexdigest()
+        return os.path.join(MAP_CACHE_DIR, 'maps_{}.npz'.format(digest))
+    
+    def _load_or_build_maps(self, frame_shape):
+        """
+        加载或计算映射表
+        
+        映射表以参数哈希为键缓存到磁盘，参数不变时无需重新计算。
+        CPU处理时缓存定点格式（CV_16SC2 + 插值系数），CUDA处理时缓存浮点格式。
+        预览模式（校准）下参数频繁变化，计算结果不写入缓存。
+        """
+        path = self._map_cache_path(frame_shape)
+        try:
+            if os.path.exists(path):
+                os.utime(path)  # 更新修改时间，清理缓存时按最近使用保留
+                with np.load(path) as data:
+                    print("已从缓存加载映射表: {}".format(path))
+                    return data['m1'], data['m2']
+        except Exception as e:
+            print("加载映射表缓存失败: {}".format(e))
+        
+        print("初始化映射表...")
+        map_x, map_y = self._init_mapping_table(frame_shape)
+        if not self.use_cuda:
+            # 转换为定点映射表：map_x 为 CV_16SC2 整数坐标，map_y 为插值系数，
+            # remap 读取的数据量减半并可使用SIMD快速路径（cv2.cuda.remap 需要浮点映射表）
+            map_x, map_y = cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+        
+        if self.preview_mode:
+            return map_x, map_y
+        
+        try:
+            os.makedirs(MAP_CACHE_DIR, exist_ok=True)
+            np.savez(path, m1=map_x, m2=map_y)
+            _prune_map_cache()
+        except Exception as e:
+            print("保存映射表缓存失败: {}".format(e))
         
         return map_x, map_y
     
@@ -170,64 +378,43 @@ class Insta360Processor:
         使用高级融合技术处理接缝区域
         
         参数:
-            panorama: 初步拼接的全景图
+            panorama: 初步拼接的全景图（原地修改）
             
         返回:
             处理后的全景图
         """
+        overlap = self.overlap_width // 2
+        if overlap <= 0:
+            return panorama
+        height = panorama.shape[0]
         half_width = self.output_width // 2
         
-        # 接缝区域的中心位置
-        left_seam_center = 0  # 0度(左边缘)
-        right_seam_center = half_width  # 180度
-        
-        # 处理左侧接缝 (0度)
-        left_overlap = self.overlap_width // 2
-        left_region1 = panorama[:, -left_overlap:].copy()
-        left_region2 = panorama[:, :left_overlap].copy()
-        
-        # 创建渐变权重
-        h, w = left_region1.shape[:2]
-        weight = np.zeros((h, left_overlap*2), dtype=np.float32)
-        for i in range(left_overlap*2):
-            weight[:, i] = i / (left_overlap*2)
-        
-        # 将权重扩展到3通道
-        weight = np.expand_dims(weight, axis=2)
-        weight = np.repeat(weight, 3, axis=2)
-        
-        # 融合左侧接缝
-        combined_left = np.concatenate((left_region1, left_region2), axis=1)
-        blended_left = left_region1 * (1 - weight[:, :left_overlap]) + left_region2 * weight[:, left_overlap:]
-        
-        # 处理右侧接缝 (180度)
-        right_overlap = self.overlap_width // 2
-        right_seam_start = right_seam_center - right_overlap
-        right_seam_end = right_seam_center + right_overlap
-        
-        right_region1 = panorama[:, right_seam_start:right_seam_center].copy()
-        right_region2 = panorama[:, right_seam_center:right_seam_end].copy()
-        
-        # 创建渐变权重
-        h, w = right_region1.shape[:2]
-        weight = np.zeros((h, right_overlap*2), dtype=np.float32)
-        for i in range(right_overlap*2):
-            weight[:, i] = i / (right_overlap*2)
+        # 渐变权重与浮点缓冲区按尺寸惰性分配，之后每帧复用
+        if self._blend_diff is None or self._blend_diff.shape != (height, overlap, 3):
+            # 一维权重通过广播作用于所有行和通道
+            self._blend_weight = np.linspace(0.0, 1.0, overlap*2, endpoint=False,
+                                             dtype=np.float32).reshape(1, -1, 1)
+            self._blend_diff = np.empty((height, overlap, 3), dtype=np.float32)
+            self._blend_out = np.empty((height, overlap*2, 3), dtype=np.float32)
+        weight, diff, out = self._blend_weight, self._blend_diff, self._blend_out
         
-        # 将权重扩展到3通道
-        weight = np.expand_dims(weight, axis=2)
-        weight = np.repeat(weight, 3, axis=2)
-        
-        # 融合右侧接缝
-        blended_right = right_region1 * (1 - weight[:, :right_overlap]) + right_region2 * weight[:, right_overlap:]
-        
-        # 应用融合结果到全景图
-        result = panorama.copy()
-        result[:, -left_overlap:] = blended_left[:, :left_overlap]
-        result[:, :left_overlap] = blended_left[:, left_overlap:]
-        result[:, right_seam_start:right_seam_end] = np.concatenate((blended_right[:, :right_overlap], blended_right[:, right_overlap:]), axis=1)
+        # 左侧接缝 (0度，跨越图像左右边缘) 与右侧接缝 (180度)：
+        # 接缝两侧各 overlap 列，region2 的权重在整个窗口内从0渐变到1
+        for start1, start2 in ((self.output_width - overlap, 0), (half_width - overlap, half_width)):
+            region1 = panorama[:, start1:start1 + overlap]
+            region2 = panorama[:, start2:start2 + overlap]
+            
+            # out = region1 + (region2 - region1) * weight，全部在预分配缓冲区中计算
+            np.subtract(region2, region1, out=diff, dtype=np.float32)
+            for part in (slice(0, overlap), slice(overlap, overlap*2)):
+                np.multiply(diff, weight[:, part], out=out[:, part])
+                np.add(out[:, part], region1, out=out[:, part])
+            
+            # 两侧区域都已读取完毕，直接写回全景图
+            np.copyto(region1, out[:, :overlap], casting='unsafe')
+            np.copyto(region2, out[:, overlap:], casting='unsafe')
         
-        return result
+        return panorama
         
     def process_frame(self, frame):
         """
@@ -238,33 +425,155 @@ class Insta360Processor:
             
         # 首次处理帧时初始化映射表
         if self.map_x is None or self.map_y is None:
-            print("初始化映射表...")
-            self.map_x, self.map_y = self._init_mapping_table(frame.shape)
+            self.map_x, self.map_y = self._load_or_build_maps(frame.shape)
+            if self.use_cuda:
+                self._map_x_gpu = cv2.cuda_GpuMat(self.map_x)
+                self._map_y_gpu = cv2.cuda_GpuMat(self.map_y)
+        
+        if self.use_cuda:
+            return self._process_frame_cuda(frame)
+        
+        self._ensure_buffers()
         
         # 使用OpenCV的重映射函数进行投影变换
         panorama = cv2.remap(frame, self.map_x, self.map_y, 
                            interpolation=cv2.INTER_LINEAR, 
+                           dst=self._pano,
                            borderMode=cv2.BORDER_CONSTANT)
         
         # 处理接缝，提高拼接质量
         panorama = self._blend_seam(panorama)
         
+        refresh = self._next_frame_is_refresh()
+        
         # 亮度均衡处理（可选）
         if self.use_brightness_equalization:
-            panorama = equalize_brightness(panorama)
+            buffers = dict(dst=self._pano_equalized, ycrcb=self._pano_ycrcb, luma=self._pano_luma)
+            if refresh or self._luma_lut is None:
+                # CLAHE只在降采样图像上运行以拟合查找表，刷新帧同样按查找表输出，
+                # 避免每隔几帧局部对比度跳变或耗时突增
+                self._luma_lut = fit_luma_lut(panorama, self._clahe)
+            panorama = equalize_brightness(panorama, luma_lut=self._luma_lut, **buffers)
             
-        # 色彩平衡（可选）
+        # 色彩平衡（可选），输出为新数组，可直接发布
         if self.use_color_balance:
-            panorama = color_balance(panorama)
+            if refresh or self._color_lut is None:
+                self._color_lut = color_balance_lut(panorama)
+            return cv2.LUT(panorama, self._color_lut)
+        
+        # 缓冲区会被下一帧复用，发布前复制
+        return panorama.copy()
+    
+    def _ensure_buffers(self):
+        """按当前输出尺寸分配逐帧复用的缓冲区"""
+        shape = (self.output_height, self.output_width, 3)
+        if self._pano is not None and self._pano.shape == shape:
+            return
+        self._pano = np.empty(shape, dtype=np.uint8)
+        self._pano_ycrcb = np.empty(shape, dtype=np.uint8)
+        self._pano_luma = np.empty(shape[:2], dtype=np.uint8)
+        self._pano_equalized = np.empty(shape, dtype=np.uint8)
+    
+    def _next_frame_is_refresh(self):
+        """推进帧计数，返回当前帧是否需要重新统计增强参数"""
+        refresh = self._frame_counter % max(self.enhance_interval, 1) == 0
+        self._frame_counter += 1
+        return refresh
+    
+    def _blend_seam_cuda(self, panorama):
+        """
+        在GPU上处理接缝区域，权重与 _blend_seam 一致
+        
+        参数:
+            panorama: GPU上初步拼接的全景图 (cv2.cuda_GpuMat)
+            
+        返回:
+            处理后的全景图 (cv2.cuda_GpuMat)
+        """
+        overlap = self.overlap_width // 2
+        if overlap <= 0:
+            return panorama
+        height = self.output_height
+        half_width = self.output_width // 2
+        
+        # 权重只依赖重叠宽度，缓存上传后的GPU权重
+        if self._seam_weights_gpu is None or self._seam_weights_gpu[0] != overlap:
+            weight = np.linspace(0.0, 1.0, overlap*2, endpoint=False, dtype=np.float32)
+            weight = np.ascontiguousarray(np.tile(weight, (height, 1)))
+            self._seam_weights_gpu = (overlap, [
+                (cv2.cuda_GpuMat(np.ascontiguousarray(1 - w)), cv2.cuda_GpuMat(np.ascontiguousarray(w)))
+                for w in (weight[:, :overlap], weight[:, overlap:])
+            ])
+        (w1_first, w2_first), (w1_second, w2_second) = self._seam_weights_gpu[1]
+        
+        # 左侧接缝 (0度，跨越图像左右边缘) 与右侧接缝 (180度)
+        for start1, start2 in ((self.output_width - overlap, 0), (half_width - overlap, half_width)):
+            region1 = cv2.cuda_GpuMat(panorama, (start1, 0, overlap, height))
+            region2 = cv2.cuda_GpuMat(panorama, (start2, 0, overlap, height))
+            # 先计算两半结果再写回，避免覆盖尚未读取的输入
+            first = cv2.cuda.blendLinear(region1, region2, w1_first, w2_first)
+            second = cv2.cuda.blendLinear(region1, region2, w1_second, w2_second)
+            first.copyTo(region1)
+            second.copyTo(region2)
         
         return panorama
     
-    def get_processed_frame(self):
-        """获取处理后的帧"""
-        with self.lock:
-            if self.processed_frame is None:
+    def _download_thumbnail(self, panorama):
+        """下载1/4尺寸（最近邻，等同CPU路径步长4的降采样）的缩略图，用于统计增强参数"""
+        return cv2.cuda.resize(panorama, (self.output_width // 4, self.output_height // 4),
+                               interpolation=cv2.INTER_NEAREST).download()
+    
+    def _process_frame_cuda(self, frame):
+        """
+        在GPU上完成重映射、接缝融合、亮度均衡与色彩平衡，只在最后下载一次
+        """
+        self._gpu_frame.upload(frame)
+        panorama = cv2.cuda.remap(self._gpu_frame, self._map_x_gpu, self._map_y_gpu,
+                                  interpolation=cv2.INTER_LINEAR,
+                                  borderMode=cv2.BORDER_CONSTANT)
+        
+        panorama = self._blend_seam_cuda(panorama)
+        
+        refresh = self._next_frame_is_refresh()
+        
+        if self.use_brightness_equalization:
+            if refresh or self._luma_lut_gpu is None:
+                # 与CPU路径相同：在1/4尺寸的缩略图上拟合亮度查找表
+                small = self._download_thumbnail(panorama)
+                lut = fit_luma_lut(small, self._clahe, step=1).reshape(1, 256)
+                self._luma_lut_gpu = cv2.cuda.createLookUpTable(lut)
+            ycrcb = cv2.cuda.cvtColor(panorama, cv2.COLOR_BGR2YCrCb)
+            y, cr, cb = cv2.cuda.split(ycrcb)
+            y = self._luma_lut_gpu.transform(y)
+            panorama = cv2.cuda.cvtColor(cv2.cuda.merge((y, cr, cb)), cv2.COLOR_YCrCb2BGR)
+        
+        if self.use_color_balance:
+            if refresh or self._color_lut_gpu is None:
+                # 截断点只需统计信息，下载1/4尺寸的缩略图即可
+                small = self._download_thumbnail(panorama)
+                lut = color_balance_lut(small, step=1).reshape(1, 256, 3)
+                self._color_lut_gpu = cv2.cuda.createLookUpTable(lut)
+            panorama = self._color_lut_gpu.transform(panorama)
+        
+        return panorama.download()
+    
+    def get_processed_frame(self, wait=False, timeout=1.0):
+        """获取处理后的帧
+        
+        每帧处理结果都是新分配的数组，发布后处理线程不会再修改它，
+        因此直接返回引用而不复制。调用方不应原地修改返回的帧。
+        
+        参数:
+            wait: 是否等待下一帧处理完成后再返回
+            timeout: 等待超时时间（秒），超时返回None
+        """
+        if wait:
+            if not self._new_frame_event.wait(timeout):
                 return None
-            return self.processed_frame.copy()
+            self._new_frame_event.clear()
+        
+        with self.lock:
+            return self.processed_frame
     
     def get_original_frame(self):
         """获取原始帧"""
@@ -283,6 +592,48 @@ class Insta360Processor:
         """
         self.use_brightness_equalization = brightness_eq
         self.use_color_balance = color_bal
+        self._frame_counter = 0  # 下一帧重新统计增强参数
         
         if overlap_width is not None:
-            self.overlap_width = overlap_width 
\ No newline at end of file
+            self.overlap_width = overlap_width
+    
+    def set_preview_mode(self, enabled, width=1280, height=640):
+        """设置预览模式
+        
+        预览模式下整个处理流程以低分辨率运行，仅适用于不推流的场景（如校准）
+        
+        参数:
+            enabled: 是否启用预览模式
+            width: 预览宽度
+            height: 预览高度
+        """
+        with self._params_lock:
+            if enabled == self.preview_mode:
+                return
+            
+            if enabled:
+                self._full_size = (self.output_width, self.output_height, self.overlap_width)
+                self.overlap_width = int(self.overlap_width * width / self.output_width)
+                self.output_width, self.output_height = width, height
+            else:
+                self.output_width, self.output_height, self.overlap_width = self._full_size
+            
+            self.preview_mode = enabled
+            self.map_x, self.map_y = None, None  # 按新尺寸重新计算映射表
+            self._frame_counter = 0
+            self._seam_weights_gpu = None
+    
+    def update_fisheye_param(self, side, key, delta):
+        """调整鱼眼镜头参数
+        
+        参数修改与映射表失效在同一把锁内完成，处理线程不会用旧参数的映射表
+        覆盖新的修改，也不会在处理某一帧的中途看到被清空的映射表
+        
+        参数:
+            side: 'left' 或 'right'
+            key: 'cx'、'cy' 或 'radius'
+            delta: 参数增量
+        """
+        with self._params_lock:
+            self.fisheye_params[side][key] += delta
+            self.map_x, self.map_y = None, None  # 重新计算映射表
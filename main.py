@@ -8,6 +8,23 @@ from insta360_processor import Insta360Processor
 from rtmp_streamer import RTMPStreamer
 
 
+# 校准按键：按键 -> (镜头, 参数, 调整方向)
+CALIBRATION_KEYS = {
+    ord('a'): ('left', 'cx', -1),      # 减少左镜头 cx
+    ord('d'): ('left', 'cx', 1),       # 增加左镜头 cx
+    ord('w'): ('left', 'cy', -1),      # 减少左镜头 cy
+    ord('s'): ('left', 'cy', 1),       # 增加左镜头 cy
+    ord('z'): ('left', 'radius', -1),  # 减少左镜头半径
+    ord('x'): ('left', 'radius', 1),   # 增加左镜头半径
+    ord('j'): ('right', 'cx', -1),     # 减少右镜头 cx
+    ord('l'): ('right', 'cx', 1),      # 增加右镜头 cx
+    ord('i'): ('right', 'cy', -1),     # 减少右镜头 cy
+    ord('k'): ('right', 'cy', 1),      # 增加右镜头 cy
+    ord('n'): ('right', 'radius', -1), # 减少右镜头半径
+    ord('m'): ('right', 'radius', 1),  # 增加右镜头半径
+}
+
+
 def load_config(config_file='config.json'):
     """
     加载配置文件
@@ -30,7 +47,8 @@ def load_config(config_file='config.json'):
             "width": 3840,
             "height": 1920,
             "fps": 30,
-            "bitrate": "4000k"
+            "bitrate": "4000k",
+            "encoder": "auto"
         },
         "processing": {
             "brightness_equalization": True,
@@ -70,6 +88,9 @@ def main():
                        help='输出视频高度 (默认: {})'.format(config['rtmp']['height']))
     parser.add_argument('--fps', type=int, default=config['rtmp']['fps'],
                        help='输出视频帧率 (默认: {})'.format(config['rtmp']['fps']))
+    parser.add_argument('--encoder', type=str, default=config['rtmp'].get('encoder', 'auto'),
+                       help='视频编码器: auto/h264_nvenc/h264_vaapi/h264_videotoolbox/libx264 (默认: {})'.format(
+                           config['rtmp'].get('encoder', 'auto')))
     parser.add_argument('--show_preview', action='store_true',
                        help='显示预览窗口')
     parser.add_argument('--calibrate', action='store_true',
@@ -85,6 +106,8 @@ def main():
                        help='重叠区域宽度 (默认: 输出宽度的{}%)'.format(config['processing']['overlap_width_percent']))
     parser.add_argument('--save_config', action='store_true',
                        help='保存当前参数为配置文件')
+    parser.add_argument('--debug', action='store_true',
+                       help='输出ffmpeg日志')
     args = parser.parse_args()
     
     # 如果需要保存配置
@@ -101,7 +124,8 @@ def main():
                 "width": args.width,
                 "height": args.height,
                 "fps": args.fps,
-                "bitrate": config['rtmp']['bitrate']
+                "bitrate": config['rtmp']['bitrate'],
+                "encoder": args.encoder
             },
             "processing": {
                 "brightness_equalization": args.brightness_eq,
@@ -138,7 +162,10 @@ def main():
         rtmp_url=args.rtmp_url,
         width=args.width,
         height=args.height,
-        fps=args.fps
+        fps=args.fps,
+        bitrate=config['rtmp']['bitrate'],
+        encoder=args.encoder,
+        debug=args.debug
     )
     
     # 启动视频处理线程和推流线程
@@ -156,12 +183,11 @@ def main():
             # 进入校准模式，调整鱼眼参数
             calibrate_fisheye_params(processor)
         
-        # 主循环
+        # 主循环：每处理完一帧推送一次
         while True:
-            # 获取处理后的帧
-            processed_frame = processor.get_processed_frame()
+            # 等待并获取新处理完成的帧
+            processed_frame = processor.get_processed_frame(wait=True)
             if processed_frame is None:
-                time.sleep(0.01)
                 continue
             
             # 推送到RTMP流
@@ -177,8 +203,6 @@ def main():
                 if key == ord('q'):
                     break
             
-            time.sleep(1.0 / args.fps)
-            
     except KeyboardInterrupt:
         print("接收到中断信号，正在停止...")
     except Exception as e:
@@ -214,6 +238,12 @@ def calibrate_fisheye_params(processor):
     
     adjustment_step = 0.01
     
+    # 校准时只关注几何对齐：以预览分辨率处理并暂停亮度/色彩增强
+    brightness_eq = processor.use_brightness_equalization
+    color_bal = processor.use_color_balance
+    processor.set_processing_options(brightness_eq=False, color_bal=False)
+    processor.set_preview_mode(True)
+    
     while True:
         # 获取处理后的帧
         frame = processor.get_processed_frame()
@@ -242,47 +272,18 @@ def calibrate_fisheye_params(processor):
         key = cv2.waitKey(1) & 0xFF
         
         # 根据按键调整参数
-        if key == ord('a'):  # 减少左镜头 cx
-            processor.fisheye_params['left']['cx'] -= adjustment_step
-            processor.map_x, processor.map_y = None, None  # 重新计算映射表
-        elif key == ord('d'):  # 增加左镜头 cx
-            processor.fisheye_params['left']['cx'] += adjustment_step
-            processor.map_x, processor.map_y = None, None
-        elif key == ord('w'):  # 减少左镜头 cy
-            processor.fisheye_params['left']['cy'] -= adjustment_step
-            processor.map_x, processor.map_y = None, None
-        elif key == ord('s'):  # 增加左镜头 cy
-            processor.fisheye_params['left']['cy'] += adjustment_step
-            processor.map_x, processor.map_y = None, None
-        elif key == ord('z'):  # 减少左镜头半径
-            processor.fisheye_params['left']['radius'] -= adjustment_step
-            processor.map_x, processor.map_y = None, None
-        elif key == ord('x'):  # 增加左镜头半径
-            processor.fisheye_params['left']['radius'] += adjustment_step
-            processor.map_x, processor.map_y = None, None
-        elif key == ord('j'):  # 减少右镜头 cx
-            processor.fisheye_params['right']['cx'] -= adjustment_step
-            processor.map_x, processor.map_y = None, None
-        elif key == ord('l'):  # 增加右镜头 cx
-            processor.fisheye_params['right']['cx'] += adjustment_step
-            processor.map_x, processor.map_y = None, None
-        elif key == ord('i'):  # 减少右镜头 cy
-            processor.fisheye_params['right']['cy'] -= adjustment_step
-            processor.map_x, processor.map_y = None, None
-        elif key == ord('k'):  # 增加右镜头 cy
-            processor.fisheye_params['right']['cy'] += adjustment_step
-            processor.map_x, processor.map_y = None, None
-        elif key == ord('n'):  # 减少右镜头半径
-            processor.fisheye_params['right']['radius'] -= adjustment_step
-            processor.map_x, processor.map_y = None, None
-        elif key == ord('m'):  # 增加右镜头半径
-            processor.fisheye_params['right']['radius'] += adjustment_step
-            processor.map_x, processor.map_y = None, None
+        if key in CALIBRATION_KEYS:
+            side, param, sign = CALIBRATION_KEYS[key]
+            processor.update_fisheye_param(side, param, sign * adjustment_step)
         elif key == ord('q'):  # 退出校准模式
             break
     
     cv2.destroyWindow('鱼眼参数校准')
     
+    # 恢复推流分辨率与处理选项
+    processor.set_preview_mode(False)
+    processor.set_processing_options(brightness_eq=brightness_eq, color_bal=color_bal)
+    
     # 保存参数到文件
     try:
         import json
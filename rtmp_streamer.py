@@ -1,9 +1,116 @@
 import cv2
+import os
+import sys
 import time
 import subprocess
 import threading
 import numpy as np
-from queue import Queue
+
+# 只有Linux支持调整管道容量（F_SETPIPE_SZ），其他平台保持默认管道容量
+if sys.platform.startswith('linux'):
+    import fcntl
+else:
+    fcntl = None
+
+
+# 帧缓冲数量：生产者正在写入、等待推送、推流线程正在写出各一个
+FRAME_SLOTS = 3
+
+# 自动选择编码器时的优先顺序：硬件编码器优先，最后回退到libx264
+ENCODER_PRIORITY = ['h264_nvenc', 'h264_vaapi', 'h264_videotoolbox', 'libx264']
+
+# 以NV12（半平面）为原生输入格式的硬件编码器
+NV12_ENCODERS = ('h264_nvenc', 'h264_vaapi', 'h264_videotoolbox')
+
+# ffmpeg退出或连接断开后重新启动前的等待时间（秒），连续失败时逐次加倍，直到上限
+RECONNECT_DELAY = 0.5
+RECONNECT_MAX_DELAY = 30.0
+
+# 连续重连失败达到此次数后停止推流
+RECONNECT_ATTEMPTS = 10
+
+# ffmpeg持续运行超过此时间（秒）视为连接正常，重连计数与等待时间复位
+RECONNECT_RESET_AFTER = 10.0
+
+# VAAPI渲染设备
+VAAPI_DEVICE = '/dev/dri/renderD128'
+
+# ffmpeg标准输入管道容量（Linux下非特权进程默认上限为1MB）
+PIPE_SIZE = 1 << 20
+F_SETPIPE_SZ = getattr(fcntl, 'F_SETPIPE_SZ', 1031)
+
+# 推流线程降低的nice值（需要相应权限，失败时忽略）
+STREAM_NICE = -5
+
+# 可用CPU达到此数量时，ffmpeg才让出推流线程所在的CPU；核心较少时编码器需要全部核心
+EXCLUSIVE_CPU_MIN = 6
+
+
+def _cuda_available():
+    """检查OpenCV是否带有CUDA支持且存在可用设备"""
+    try:
+        return cv2.cuda.getCudaEnabledDeviceCount() > 0
+    except (AttributeError, cv2.error):
+        return False
+
+
+def _write_all(fd, data):
+    """将缓冲区完整写入文件描述符，处理部分写入"""
+    while data:
+        written = os.write(fd, data)
+        data = data[written:]
+
+
+def _pin_stream_thread():
+    """
+    将当前线程绑定到最后一个可用CPU并提高调度优先级，减少写帧时被抢占的抖动
+    
+    返回:
+        ffmpeg进程应使用的CPU集合（从本线程启动的进程会继承单核绑定，需要重新设置）：
+        可用CPU不少于 EXCLUSIVE_CPU_MIN 个时为其余CPU，否则为全部可用CPU；无法绑定时为None
+    """
+    if not hasattr(os, 'sched_setaffinity'):  # 仅Linux支持
+        return None
+    try:
+        cpus = sorted(os.sched_getaffinity(0))
+        if len(cpus) < 2:
+            return None
+        # Linux下pid为0时只作用于调用线程，nice同样按线程生效
+        os.sched_setaffinity(0, {cpus[-1]})
+    except OSError as e:
+        print("绑定推流线程CPU失败: {}".format(e))
+        return None
+    try:
+        os.nice(STREAM_NICE)
+    except OSError:
+        pass  # 非特权用户不能降低nice值
+    if len(cpus) >= EXCLUSIVE_CPU_MIN:
+        return set(cpus[:-1])
+    return set(cpus)
+
+
+def probe_encoders():
+    """
+    查询本机ffmpeg支持的编码器
+    
+    返回:
+        编码器名称集合，ffmpeg不可用时为空集合
+    """
+    try:
+        output = subprocess.run(['ffmpeg', '-hide_banner', '-encoders'],
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                timeout=10).stdout.decode('utf-8', 'ignore')
+    except (OSError, subprocess.SubprocessError) as e:
+        print("查询ffmpeg编码器失败: {}".format(e))
+        return set()
+    
+    # 每行格式形如 " V....D h264_nvenc  NVIDIA NVENC H.264 encoder"
+    encoders = set()
+    for line in output.splitlines():
+        parts = line.split()
+        if len(parts) >= 2 and parts[0].startswith('V'):
+            encoders.add(parts[1])
+    return encoders
 
 
 class RTMPStreamer:
@@ -11,7 +118,7 @@ class RTMPStreamer:
     将视频帧推送到RTMP服务器
     """
     
-    def __init__(self, rtmp_url, width=3840, height=1920, fps=30, bitrate='4000k'):
+    def __init__(self, rtmp_url, width=3840, height=1920, fps=30, bitrate='4000k', encoder='auto', debug=False):
         """
         初始化RTMP推流器
         
@@ -21,24 +128,71 @@ class RTMPStreamer:
             height: 视频高度
             fps: 帧率
             bitrate: 码率
+            encoder: 视频编码器（'auto' 自动选择可用的硬件编码器，
+                     或 'h264_nvenc'、'h264_vaapi'、'h264_videotoolbox'、'libx264'）
+            debug: 是否逐行输出ffmpeg的日志，默认丢弃
         """
         self.rtmp_url = rtmp_url
         self.width = width
         self.height = height
         self.fps = fps
         self.bitrate = bitrate
+        self.encoder = self._select_encoder(encoder)
+        self.debug = debug
+        
+        # 硬件编码器直接输入NV12，省去ffmpeg内部的色度重排；libx264原生使用yuv420p
+        self._input_pix_fmt = 'nv12' if self.encoder in NV12_ENCODERS else 'yuv420p'
+        self._chroma = (np.empty((self.height // 2, self.width), dtype=np.uint8)
+                        if self._input_pix_fmt == 'nv12' else None)
         
         self.running = False
-        self.frame_queue = Queue(maxsize=10)  # 保持小的队列以减少延迟
         self.process = None
         self.thread = None
         
+        # 输出尺寸（与 frame.shape[:2] 顺序一致），缩放函数按输入尺寸缓存，避免每帧重新选择插值方式
+        self._out_hw = (self.height, self.width)
+        self._scaler_size = None
+        self._scaler = None
+        
+        # 有CUDA设备时在GPU上缩放，结果下载到预分配的缓冲区
+        self._use_cuda = _cuda_available()
+        self._gpu_frame = cv2.cuda_GpuMat() if self._use_cuda else None
+        self._resized = np.empty((self.height, self.width, 3), dtype=np.uint8) if self._use_cuda else None
+        
+        # "最新帧优先"的单槽交换：所有I420帧缓冲是同一块连续内存的视图，
+        # 转换结果直接写入缓冲，推流线程从缓冲直接写入管道，Python侧没有额外复制。
+        # push_frame（单一生产者）写好 _write_slot 后与 _latest 交换，未推送的旧帧直接被覆盖。
+        # 线程间只传递槽位编号；缓冲来自零填充的bytearray，内存页在初始化时即已分配，
+        # 每个槽位的字节视图也只创建一次，推流线程直接将其写入管道
+        frame_size = self.height * 3 // 2 * self.width
+        self._tx_buf = bytearray(FRAME_SLOTS * frame_size)
+        self._slot_buffer = np.frombuffer(self._tx_buf, dtype=np.uint8).reshape(
+            FRAME_SLOTS, self.height * 3 // 2, self.width)
+        tx_view = memoryview(self._tx_buf)
+        self._slot_bytes = [tx_view[i * frame_size:(i + 1) * frame_size] for i in range(FRAME_SLOTS)]
+        self._slot_lock = threading.Lock()
+        self._reset_slots()
+        
+        # ffmpeg命令在此一次生成，重连时复用
+        self._ffmpeg_cmd = self._build_command()
+        
+        # ffmpeg进程使用的CPU与nice值（推流线程绑核、提高优先级后，从其启动的ffmpeg需要恢复）
+        self._ffmpeg_cpus = None
+        self._ffmpeg_nice = None
+        
+        # 有新帧待推送时触发，推流线程据此等待而不是轮询
+        self._new_frame = threading.Event()
+        
+        # 停止推流时触发，用于打断重连前的等待
+        self._stop_event = threading.Event()
+        
     def start(self):
         """启动推流线程"""
         if self.running:
             return
             
         self.running = True
+        self._stop_event.clear()
         self.thread = threading.Thread(target=self._stream_loop)
         self.thread.daemon = True
         self.thread.start()
@@ -46,6 +200,8 @@ class RTMPStreamer:
     def stop(self):
         """停止推流"""
         self.running = False
+        self._new_frame.set()  # 唤醒等待中的推流线程
+        self._stop_event.set()  # 打断重连前的等待
         
         if self.thread is not None:
             self.thread.join(timeout=1.0)
@@ -58,104 +214,323 @@ class RTMPStreamer:
                 self.process.kill()
             self.process = None
             
-        # 清空帧队列
-        while not self.frame_queue.empty():
-            try:
-                self.frame_queue.get_nowait()
-            except:
-                pass
+        # 丢弃待推送的帧
+        self._discard_pending()
                 
-    def push_frame(self, frame):
+    def push_frame(self, frame, is_yuv=False):
         """
         将视频帧添加到队列
         
         参数:
             frame: OpenCV/Numpy格式的视频帧
+            is_yuv: 帧是否已是输出分辨率的I420格式（形状为 (H*3/2, W)），是则跳过颜色转换
+            
+        返回:
+            帧是否已提交；推流已停止（包括推流线程因错误或重连失败退出）时为False
         """
         if not self.running:
             return False
         
-        # 调整大小以匹配输出分辨率
-        if frame.shape[0] != self.height or frame.shape[1] != self.width:
-            frame = cv2.resize(frame, (self.width, self.height))
+        index = self._write_slot
+        slot = self._slot_buffer[index]
+        
+        if is_yuv:
+            np.copyto(slot, frame)
+        else:
+            # 调整大小以匹配输出分辨率
+            if frame.shape[:2] != self._out_hw:
+                frame = self._resize(frame)
             
-        # 尝试添加到队列，如果队列已满则丢弃最旧的帧
-        if self.frame_queue.full():
-            try:
-                self.frame_queue.get_nowait()
-            except:
-                pass
-                
+            # 转换为平面I420格式直接写入帧槽，管道传输数据量减半，ffmpeg也无需再转换颜色空间
+            cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420, dst=slot)
+        
+        if self._input_pix_fmt == 'nv12':
+            self._i420_to_nv12(slot)
+        
+        # 帧数据写完后再发布：替换待推送的帧，被替换的旧帧缓冲留作下一次写入
+        with self._slot_lock:
+            previous, self._latest = self._latest, index
+            self._write_slot = previous if previous is not None else self._free_slots.pop()
+        self._new_frame.set()
+        return True
+    
+    def _i420_to_nv12(self, frame):
+        """将I420帧的U、V平面原地重排为交错的UV平面（NV12）"""
+        chroma = frame[self.height:]
+        np.copyto(self._chroma, chroma)
+        
+        quarter = self.height * self.width // 4
+        flat = self._chroma.reshape(-1)
+        uv = chroma.reshape(self.height // 2, self.width // 2, 2)
+        uv[:, :, 0] = flat[:quarter].reshape(self.height // 2, self.width // 2)
+        uv[:, :, 1] = flat[quarter:].reshape(self.height // 2, self.width // 2)
+    
+    def _discard_pending(self):
+        """丢弃待推送的帧，在锁内一次完成，不影响推流线程正在写出的缓冲"""
+        with self._slot_lock:
+            if self._latest is not None:
+                self._free_slots.append(self._latest)
+                self._latest = None
+    
+    def _reset_slots(self):
+        """将所有帧缓冲恢复为空闲状态"""
+        with self._slot_lock:
+            slots = list(range(FRAME_SLOTS))
+            self._write_slot = slots.pop()
+            self._free_slots = slots
+            self._latest = None
+    
+    def _resize(self, frame):
+        """将帧缩放到输出分辨率，缩放方式在输入尺寸变化时选择一次"""
+        size = frame.shape[:2]
+        if self._scaler_size != size:
+            self._scaler_size = size
+            self._scaler = self._make_scaler(*size)
+        return self._scaler(frame)
+    
+    def _make_scaler(self, in_height, in_width):
+        """根据输入尺寸选择缩放方式"""
+        dsize = (self.width, self.height)
+        
+        # 精确的2:1缩小使用固定5x5核的 pyrDown
+        if in_width == self.width * 2 and in_height == self.height * 2:
+            return lambda frame: cv2.pyrDown(frame, dstsize=dsize)
+        
+        # 缩小使用INTER_AREA（质量更好），放大使用INTER_LINEAR
+        if in_width >= self.width and in_height >= self.height:
+            interpolation = cv2.INTER_AREA
+        else:
+            interpolation = cv2.INTER_LINEAR
+        
+        if self._use_cuda:
+            def resize_cuda(frame):
+                self._gpu_frame.upload(frame)
+                cv2.cuda.resize(self._gpu_frame, dsize, interpolation=interpolation).download(self._resized)
+                return self._resized
+            return resize_cuda
+        
+        return lambda frame: cv2.resize(frame, dsize, interpolation=interpolation)
+    
+    def _select_encoder(self, encoder):
+        """解析编码器设置，'auto' 时按优先顺序选择ffmpeg支持的第一个编码器"""
+        if encoder != 'auto':
+            return encoder
+        available = probe_encoders()
+        for name in ENCODER_PRIORITY:
+            if name in available and (name == 'libx264' or self._encoder_works(name)):
+                print("使用视频编码器: {}".format(name))
+                return name
+        return 'libx264'
+    
+    def _encoder_works(self, encoder):
+        """编码一帧测试图像，确认硬件编码器在本机实际可用（编译支持不代表有对应硬件）"""
+        input_args, output_args = self._encoder_args(encoder)
+        command = ['ffmpeg', '-hide_banner', '-loglevel', 'error'] + input_args + [
+            '-f', 'lavfi', '-i', 'color=size=256x256', '-frames:v', '1',
+        ] + output_args + ['-f', 'null', '-']
         try:
-            self.frame_queue.put_nowait(frame)
-            return True
-        except:
+            return subprocess.run(command, stdout=subprocess.DEVNULL,
+                                  stderr=subprocess.DEVNULL, timeout=10).returncode == 0
+        except (OSError, subprocess.SubprocessError):
             return False
     
-    def _stream_loop(self):
-        """推流处理循环"""
-        # 创建FFMPEG命令
-        command = [
+    def _encoder_args(self, encoder=None):
+        """
+        生成编码器相关的ffmpeg参数
+        
+        参数:
+            encoder: 编码器名称，默认为当前选择的编码器
+            
+        返回:
+            (input_args, output_args): 输入之前的全局参数与输出编码参数
+        """
+        encoder = encoder or self.encoder
+        if encoder == 'h264_nvenc':
+            return [], [
+                '-c:v', 'h264_nvenc',
+                '-preset', 'p1',        # 最快的编码预设
+                '-tune', 'll',          # 低延迟
+                '-zerolatency', '1',
+                '-rc', 'cbr',
+                '-delay', '0',
+                '-forced-idr', '1',
+                '-g', str(self.fps * 2),
+            ]
+        if encoder == 'h264_vaapi':
+            return ['-vaapi_device', VAAPI_DEVICE], [
+                '-vf', 'format=nv12,hwupload',  # 上传到VAAPI表面
+                '-c:v', 'h264_vaapi',
+            ]
+        if encoder == 'h264_videotoolbox':
+            return [], [
+                '-c:v', 'h264_videotoolbox',
+                '-realtime', 'true',
+                '-pix_fmt', 'nv12',  # 与输入一致，避免swscale再转换回yuv420p
+            ]
+        output_args = [
+            '-c:v', encoder,
+            '-pix_fmt', 'yuv420p',  # 兼容性好的像素格式
+            '-preset', 'ultrafast', # 最快的编码速度
+            '-tune', 'zerolatency', # 低延迟
+        ]
+        if encoder == 'libx264':
+            # 使用全部CPU核心按条带并行编码，并关闭前瞻、B帧等会引入延迟的特性
+            output_args += [
+                '-threads', '0',
+                '-x264-params', 'threads=auto:sliced-threads=1:sync-lookahead=0:rc-lookahead=0:'
+                                'bframes=0:ref=1:keyint={}:no-scenecut=1'.format(self.fps * 2),
+            ]
+        return [], output_args
+    
+    def _build_command(self):
+        """生成ffmpeg推流命令（参数在推流器生命周期内不变，重连时直接复用）"""
+        input_args, output_args = self._encoder_args()
+        return [
             'ffmpeg',
             '-y',  # 覆盖输出文件
+        ] + input_args + [
             '-f', 'rawvideo',
             '-vcodec', 'rawvideo',
-            '-pix_fmt', 'bgr24',  # OpenCV使用BGR颜色空间
+            '-pix_fmt', self._input_pix_fmt,  # 输入已在Python侧转换为I420/NV12
             '-s', '{}x{}'.format(self.width, self.height),
-            '-r', str(self.fps),
+            '-framerate', str(self.fps),  # 仅作为标称帧率；输入端的 -r 会改写时间戳，不能使用
+            '-use_wallclock_as_timestamps', '1',  # 以帧到达ffmpeg的时间作为时间戳，由ffmpeg负责节拍
+            '-fflags', 'nobuffer+genpts',  # 不缓冲输入，并生成缺失的PTS
             '-i', '-',  # 从标准输入读取
-            '-c:v', 'libx264',
-            '-pix_fmt', 'yuv420p',  # 兼容性好的像素格式
-            '-preset', 'ultrafast', # 最快的编码速度
-            '-tune', 'zerolatency', # 低延迟
+        ] + output_args + [
+            '-fps_mode', 'cfr',  # 按到达时间戳补帧或丢帧，输出恒定帧率
+            '-r', str(self.fps),
             '-b:v', self.bitrate,
+            '-flags', 'low_delay',
+            '-max_delay', '0',  # 关闭复用器的缓冲延迟
+            '-muxdelay', '0',
+            '-muxpreload', '0',
+            '-flush_packets', '1',  # 每个数据包立即写出
+            '-max_interleave_delta', '0',  # 不为交织等待其他流
+            '-max_muxing_queue_size', '1024',
             '-f', 'flv',  # RTMP需要FLV格式
             self.rtmp_url
         ]
-        
-        # 启动FFMPEG进程
+    
+    def _start_process(self):
+        """启动FFMPEG进程，返回其标准输入的文件描述符"""
+        # stderr不读取时必须丢弃，否则日志写满管道后ffmpeg会阻塞
         self.process = subprocess.Popen(
-            command,
+            self._ffmpeg_cmd,
             stdin=subprocess.PIPE,
-            stderr=subprocess.PIPE
+            stderr=subprocess.PIPE if self.debug else subprocess.DEVNULL
         )
+        if self._ffmpeg_cpus:
+            try:
+                os.sched_setaffinity(self.process.pid, self._ffmpeg_cpus)
+            except OSError as e:
+                print("绑定FFMPEG进程CPU失败: {}".format(e))
+        if self._ffmpeg_nice is not None:
+            try:
+                os.setpriority(os.PRIO_PROCESS, self.process.pid, self._ffmpeg_nice)
+            except OSError as e:
+                print("恢复FFMPEG进程优先级失败: {}".format(e))
+        if self.debug:
+            log_thread = threading.Thread(target=self._log_stderr, args=(self.process.stderr,))
+            log_thread.daemon = True
+            log_thread.start()
         
+        # 增大管道容量并绕过BufferedWriter直接写文件描述符，减少每帧的系统调用次数
+        stdin_fd = self.process.stdin.fileno()
+        if fcntl is not None:
+            try:
+                fcntl.fcntl(stdin_fd, F_SETPIPE_SZ, PIPE_SIZE)
+            except OSError as e:
+                print("设置管道容量失败: {}".format(e))
+        return stdin_fd
+    
+    def _log_stderr(self, stderr):
+        """逐行输出ffmpeg的日志，直到ffmpeg退出"""
+        with stderr:
+            for line in stderr:
+                print("[ffmpeg] {}".format(line.decode('utf-8', 'ignore').rstrip()))
+    
+    def _close_process(self, process):
+        """关闭FFMPEG进程"""
+        if process.poll() is None:
+            try:
+                process.stdin.close()
+                process.wait(timeout=2.0)
+            except:
+                process.kill()
+                process.wait()  # 回收进程并记录返回码
+    
+    def _stream_loop(self):
+        """推流处理循环：ffmpeg退出或连接断开时，等待片刻后重启ffmpeg，帧缓冲保持不变"""
+        if hasattr(os, 'getpriority'):
+            self._ffmpeg_nice = os.getpriority(os.PRIO_PROCESS, 0)
+        self._ffmpeg_cpus = _pin_stream_thread()
+        
+        delay = RECONNECT_DELAY
+        failures = 0
+        
+        while self.running:
+            try:
+                stdin_fd = self._start_process()
+            except OSError as e:
+                print("启动FFMPEG失败: {}".format(e))
+                self.running = False  # push_frame 据此停止转换并返回False
+                break
+            process = self.process
+            started = time.monotonic()
+            
+            try:
+                self._feed_process(process, stdin_fd)
+            except (BrokenPipeError, ConnectionResetError) as e:
+                print("推流连接断开: {}".format(e))
+            except IOError as e:
+                print("推流出错: {}".format(e))
+                self.running = False
+                break
+            except Exception as e:
+                print("推流过程中发生错误: {}".format(e))
+                self.running = False
+                break
+            finally:
+                self._close_process(process)
+                self.process = None
+            
+            if not self.running:
+                break
+            
+            print("FFMPEG已退出，返回码: {}（使用 --debug 查看ffmpeg日志）".format(process.returncode))
+            
+            # 运行足够久说明此前连接正常，从最短等待重新开始；否则逐次加倍等待时间
+            if time.monotonic() - started >= RECONNECT_RESET_AFTER:
+                delay = RECONNECT_DELAY
+                failures = 0
+            failures += 1
+            if failures > RECONNECT_ATTEMPTS:
+                print("连续{}次重连失败，停止推流".format(RECONNECT_ATTEMPTS))
+                self.running = False
+                break
+            
+            print("{}秒后重新连接RTMP服务器（第{}/{}次）".format(delay, failures, RECONNECT_ATTEMPTS))
+            self._stop_event.wait(delay)
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+    
+    def _feed_process(self, process, stdin_fd):
+        """将最新的帧一到达就写入FFMPEG进程（时间戳由ffmpeg按到达时间生成），直到推流停止或ffmpeg退出"""
         frame_time = 1.0 / self.fps
-        next_frame_time = time.time()
         
-        try:
-            while self.running and self.process.poll() is None:
-                if self.frame_queue.empty():
-                    # 没有新的帧，等待一小段时间
-                    time.sleep(0.001)
-                    continue
-                    
-                # 获取下一帧
-                frame = self.frame_queue.get()
-                
-                # 计算需要等待的时间，保持帧率稳定
-                current_time = time.time()
-                wait_time = max(0, next_frame_time - current_time)
-                if wait_time > 0:
-                    time.sleep(wait_time)
-                
-                # 更新下一帧的时间戳
-                next_frame_time = max(time.time(), next_frame_time + frame_time)
-                
-                # 将帧写入FFMPEG进程
-                self.process.stdin.write(frame.tobytes())
-                
-        except (BrokenPipeError, IOError) as e:
-            print("推流出错: {}".format(e))
-        except Exception as e:
-            print("推流过程中发生错误: {}".format(e))
-        finally:
-            # 关闭FFMPEG进程
-            if self.process.poll() is None:
-                try:
-                    self.process.stdin.close()
-                    self.process.wait(timeout=2.0)
-                except:
-                    self.process.kill()
+        while self.running and process.poll() is None:
+            # 取走最新的帧（写出完成前该缓冲不会被生产者覆盖）
+            with self._slot_lock:
+                index, self._latest = self._latest, None
+                self._new_frame.clear()
+            if index is None:
+                # 没有新的帧，等待生产者通知
+                self._new_frame.wait(timeout=frame_time)
+                continue
             
-            self.process = None
+            # 将帧写入FFMPEG进程（直接传递预先创建的字节视图，避免tobytes复制）；写入失败时缓冲同样归还
+            try:
+                _write_all(stdin_fd, self._slot_bytes[index])
+            finally:
+                with self._slot_lock:
+                    self._free_slots.append(index)